@@ -1,13 +1,15 @@
 import csv
 import datetime
-import json
+import functools
 import os
+from collections.abc import Generator
 from io import StringIO
 from typing import Optional
 
 import geopandas as gpd
 import numpy as np
 import plotly.express as px
+import plotly.io as pio
 import shapely
 from flask import Flask, Response, make_response, render_template, request, url_for
 
@@ -19,6 +21,10 @@ from source_modelling.sources import Fault
 
 app = Flask(__name__)
 NSHMDB_PATH = os.environ["NSHMDB_PATH"]
+NSHM_DB = nshmdb.NSHMDB(NSHMDB_PATH)
+# Serialise figures with orjson, which is much faster than the stdlib
+# encoder for the long coordinate arrays in rupture maps.
+pio.json.config.default_engine = "orjson"
 
 
 def default_magnitude_estimation(
@@ -38,20 +44,30 @@ def default_magnitude_estimation(
     dict
         A dictionary where the keys are fault names and the values are the estimated magnitudes for each fault.
     """
-    total_area = sum(fault.area() for fault in faults.values())
-    avg_rake = np.mean(list(rakes.values()))
+    areas = np.fromiter(
+        (fault.area() for fault in faults.values()),
+        dtype=np.float64,
+        count=len(faults),
+    )
+    total_area = areas.sum()
+    avg_rake = float(
+        np.fromiter(rakes.values(), dtype=np.float64, count=len(rakes)).mean()
+    )
     estimated_mw = mag_scaling.a_to_mw_leonard(total_area, 4, 3.99, avg_rake)
     estimated_moment = mag_scaling.mag2mom(estimated_mw)
-    return {
-        fault_name: mag_scaling.mom2mag((fault.area() / total_area) * estimated_moment)
-        for fault_name, fault in faults.items()
-    }
+    # Partition the moment by area share and convert every fault back at once.
+    fault_magnitudes = mag_scaling.mom2mag((areas / total_area) * estimated_moment)
+    return dict(zip(faults, fault_magnitudes.tolist()))
 
 
-@app.route("/rupture_map/<rupture_id>")
+@app.route("/rupture_map/<int:rupture_id>")
+@functools.lru_cache(maxsize=128)
 def rupture_map(rupture_id: int) -> str:
     """Return a map of the rupture.
 
+    The rendered map only depends on the rupture id, so it is cached
+    to skip the database queries and figure rendering on repeat visits.
+
     Parameters
     ----------
     rupture_id : int
@@ -62,41 +78,58 @@ def rupture_map(rupture_id: int) -> str:
     str
         A map of the rupture faults.
     """
-    db = nshmdb.NSHMDB(NSHMDB_PATH)
-    rupture = db.get_rupture(rupture_id)
-    fault_info = db.get_rupture_fault_info(rupture_id)
+    rupture = NSHM_DB.get_rupture(rupture_id)
+    fault_info = NSHM_DB.get_rupture_fault_info(rupture_id)
     magnitudes = default_magnitude_estimation(
         rupture.faults, {name: info.rake for name, info in fault_info.items()}
     )
-    fault_rates = db.most_likely_fault(rupture_id, magnitudes)
-    rupture.faults = {
-        fault_name: fault
-        for fault_name, fault in rupture.faults.items()
-        if not fault.geometry.is_empty
-    }
+    fault_rates = NSHM_DB.most_likely_fault(rupture_id, magnitudes)
+    names = []
+    fault_geometries = []
+    widths = []
+    lengths = []
+    segments = []
+    segment_rates = []
+    for fault_name, fault in rupture.faults.items():
+        if fault.geometry.is_empty:
+            continue
+        segment_count = len(fault.planes)
+        names.append(fault_name)
+        fault_geometries.append(fault.geometry)
+        widths.append(int(round(fault.width)))
+        lengths.append(int(round(fault.length)))
+        segments.append(segment_count)
+        segment_rates.append(fault_rates.get(fault_name, 0) / segment_count)
+    # Reproject every fault in one call rather than one shapely.transform per
+    # fault. set_coordinates returns new geometries and leaves the faults as is.
+    wgs_coordinates = coordinates.nztm_to_wgs_depth(
+        shapely.get_coordinates(fault_geometries)
+    )[:, ::-1]
     ring = gpd.GeoDataFrame(
-        index=list(rupture.faults),
-        geometry=[
-            shapely.transform(
-                fault.geometry,
-                lambda coord: coordinates.nztm_to_wgs_depth(coord)[:, ::-1],
-            )
-            for fault in rupture.faults.values()
-        ],
+        {
+            "Name": names,
+            "Width (km)": widths,
+            "Length (km)": lengths,
+            "Segments": segments,
+            "Mean Segment Rupture Rate": segment_rates,
+        },
+        index=names,
+        geometry=shapely.set_coordinates(fault_geometries, wgs_coordinates),
     )
-    ring["Name"] = list(rupture.faults)
-    ring["Width (km)"] = [int(round(fault.width)) for fault in rupture.faults.values()]
-    ring["Length (km)"] = [
-        int(round(fault.length)) for fault in rupture.faults.values()
-    ]
-    ring["Segments"] = [len(fault.planes) for fault in rupture.faults.values()]
-    ring["Mean Segment Rupture Rate"] = [
-        fault_rates.get(fault_name, 0) / len(fault.planes)
-        for fault_name, fault in rupture.faults.items()
-    ]
     fig = px.choropleth_map(
         data_frame=ring,
-        geojson=json.loads(ring.to_json()),
+        geojson={
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "id": name,
+                    "geometry": geometry.__geo_interface__,
+                    "properties": {},
+                }
+                for name, geometry in zip(ring.index, ring.geometry)
+            ],
+        },
         locations=ring.index,
         color="Mean Segment Rupture Rate",
         hover_name="Name",
@@ -139,6 +172,75 @@ def rupture_fault_summary(faults: dict[str, Fault]) -> str:
     return summary
 
 
+@functools.lru_cache(maxsize=256)
+def query_ruptures(
+    query: str,
+    magnitude_bounds: tuple[Optional[float], Optional[float]],
+    log_rate_bounds: tuple[Optional[float], Optional[float]],
+    fault_count_limit: Optional[int],
+) -> dict[int, Rupture]:
+    """Query the NSHMDB for the first 100 ruptures matching a search.
+
+    Results are cached because paging back and forth between searches
+    repeats the same queries.
+
+    Parameters
+    ----------
+    query : str
+        The fault search query.
+    magnitude_bounds : tuple[Optional[float], Optional[float]]
+        The lower and upper magnitude bounds.
+    log_rate_bounds : tuple[Optional[float], Optional[float]]
+        The lower and upper bounds on the log10 rupture rate.
+    fault_count_limit : Optional[int]
+        The maximum number of faults in a rupture.
+
+    Returns
+    -------
+    dict[int, Rupture]
+        The matching ruptures, keyed by rupture id. The result is shared
+        between callers and must not be modified.
+    """
+    return NSHM_DB.query(
+        query,
+        magnitude_bounds=magnitude_bounds,
+        rate_bounds=tuple(
+            10**bound if bound is not None else None for bound in log_rate_bounds
+        ),
+        limit=100,
+        fault_count_limit=fault_count_limit,
+    )
+
+
+def rupture_magnitudes(ruptures: dict[int, Rupture]) -> dict[int, float]:
+    """Estimate rupture magnitudes from their total fault area (Leonard 2014).
+
+    Parameters
+    ----------
+    ruptures : dict[int, Rupture]
+        The ruptures to estimate magnitudes for, keyed by rupture id.
+
+    Returns
+    -------
+    dict[int, float]
+        The estimated magnitude of each rupture, keyed by rupture id.
+    """
+    if not ruptures:
+        return {}
+    fault_areas = np.array(
+        [
+            fault.area()
+            for rupture in ruptures.values()
+            for fault in rupture.faults.values()
+        ]
+    )
+    # Each rupture's faults are contiguous in fault_areas, starting at these offsets.
+    offsets = np.cumsum([0] + [len(rupture.faults) for rupture in ruptures.values()])
+    total_areas = np.add.reduceat(fault_areas, offsets[:-1])
+    magnitudes = mag_scaling.a_to_mw_leonard(total_areas, 4, 3.99, 0)
+    return dict(zip(ruptures, magnitudes.tolist()))
+
+
 @app.route("/ruptures", methods=["POST"])
 def ruptures() -> str:
     """Query the NSHMDB based on a query string and filtering parameters.
@@ -169,23 +271,13 @@ def ruptures() -> str:
     max_fault_count: Optional[int] = request.form.get(
         "max_fault_count", default=None, type=int
     )
-    db = nshmdb.NSHMDB(NSHMDB_PATH)
-    ruptures = db.query(
+    ruptures = query_ruptures(
         query,
-        magnitude_bounds=(magnitude_lower_bound, magnitude_upper_bound),
-        rate_bounds=(
-            10**rate_lower_bound if rate_lower_bound is not None else None,
-            10**rate_upper_bound if rate_upper_bound is not None else None,
-        ),
-        limit=100,
-        fault_count_limit=max_fault_count,
+        (magnitude_lower_bound, magnitude_upper_bound),
+        (rate_lower_bound, rate_upper_bound),
+        max_fault_count,
     )
-    magnitudes = {
-        rupture_id: mag_scaling.a_to_mw_leonard(
-            sum(fault.area() for fault in rupture.faults.values()), 4, 3.99, 0
-        )
-        for rupture_id, rupture in ruptures.items()
-    }
+    magnitudes = rupture_magnitudes(ruptures)
     response = make_response(
         render_template("ruptures.html", ruptures=ruptures, magnitudes=magnitudes)
     )
@@ -203,33 +295,36 @@ def ruptures() -> str:
 
 @app.route("/download")
 def download():
-    """Serve a CSV file containing all the filtered ruptures."""
+    """Serve a CSV file containing all the filtered ruptures.
+
+    Rows are streamed as each rupture is loaded, so the download starts
+    without waiting for every rupture to be read.
+    """
     rupture_ids = [
         int(rupture_id) for rupture_id in request.args.get("ruptures").split(",")
     ]
-    db = nshmdb.NSHMDB(NSHMDB_PATH)
-    ruptures: dict[int, Rupture] = {
-        rupture_id: db.get_rupture(rupture_id) for rupture_id in rupture_ids
-    }
-    csv_out = StringIO()
-    writer = csv.DictWriter(
-        csv_out, ["Rupture ID", "Magnitude", "Area", "Length", "Rate"]
-    )
-    writer.writeheader()
-    writer.writerows(
-        [
-            {
-                "Rupture ID": rupture_id,
-                "Magnitude": rupture.magnitude,
-                "Area": rupture.area,
-                "Length": rupture.length,
-                "Rate": rupture.rate,
-            }
-            for rupture_id, rupture in ruptures.items()
-        ]
-    )
-    response: Response = make_response(csv_out.getvalue())
-    response.mimetype = "application/x-csv"
+
+    def csv_rows() -> Generator[str, None, None]:
+        """Yield the CSV header followed by one row per rupture."""
+        csv_out = StringIO()
+        writer = csv.writer(csv_out)
+        writer.writerow(["Rupture ID", "Magnitude", "Area", "Length", "Rate"])
+        for rupture_id in rupture_ids:
+            rupture = NSHM_DB.get_rupture(rupture_id)
+            writer.writerow(
+                [
+                    rupture_id,
+                    rupture.magnitude,
+                    rupture.area,
+                    rupture.length,
+                    rupture.rate,
+                ]
+            )
+            yield csv_out.getvalue()
+            csv_out.seek(0)
+            csv_out.truncate()
+
+    response = Response(csv_rows(), mimetype="application/x-csv")
     response.headers["Content-Disposition"] = (
         f"attachment; filename=ruptures_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M')}.csv"
     )
@@ -256,26 +351,16 @@ def index() -> str:
     max_fault_count: Optional[int] = request.args.get(
         "max_fault_count", default=None, type=int
     )
-    db = nshmdb.NSHMDB(NSHMDB_PATH)
     ruptures = None
     magnitudes = None
     if query:
-        ruptures = db.query(
+        ruptures = query_ruptures(
             query,
-            magnitude_bounds=(magnitude_lower_bound, magnitude_upper_bound),
-            rate_bounds=(
-                10**rate_lower_bound if rate_lower_bound is not None else None,
-                10**rate_upper_bound if rate_upper_bound is not None else None,
-            ),
-            limit=100,
-            fault_count_limit=max_fault_count,
+            (magnitude_lower_bound, magnitude_upper_bound),
+            (rate_lower_bound, rate_upper_bound),
+            max_fault_count,
         )
-        magnitudes = {
-            rupture_id: mag_scaling.a_to_mw_leonard(
-                sum(fault.area() for fault in rupture.faults.values()), 4, 3.99, 0
-            )
-            for rupture_id, rupture in ruptures.items()
-        }
+        magnitudes = rupture_magnitudes(ruptures)
     return render_template(
         "index.html",
         query=query,